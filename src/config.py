@@ -3,19 +3,29 @@ from typing import Dict, Any, Final
 
 # --- 1. CORE ENUMS (Expanded) ---
 
-class ToolType(enum.Enum):
-    """Defines standard tool functionalities in the Model Context Protocol (MCP) ecosystem."""
-    MATH_COMPUTE = "MATH_COMPUTE"
-    DATA_RETRIEVAL = "DATA_RETRIEVAL"
-    REASONING = "REASONING"
-    IMAGE_GEN = "IMAGE_GEN"
-    SEMANTIC_SEARCH = "SEMANTIC_SEARCH"
+class ToolType(enum.IntEnum):
+    """
+    Defines standard tool functionalities in the Model Context Protocol (MCP) ecosystem.
+    Dense integer values so per-tool tables can be plain lists indexed by tool type.
+    """
+    MATH_COMPUTE = 0
+    DATA_RETRIEVAL = 1
+    REASONING = 2
+    IMAGE_GEN = 3
+    SEMANTIC_SEARCH = 4
 
-class Status(enum.Enum):
-    """Defines standard status codes for transaction logs."""
-    SUCCESS = "SUCCESS"
-    ERROR = "ERROR"
-    TIMEOUT = "TIMEOUT"
+class Status(enum.IntEnum):
+    """Defines standard status codes for transaction logs (stored as ints; use Status(code).name for display)."""
+    SUCCESS = 0
+    ERROR = 1
+    TIMEOUT = 2
+
+class TaskStatus(enum.IntEnum):
+    """Defines routing/execution outcomes reported by the MCP Client for a single task."""
+    OK = 0      # Executed successfully on a trusted server
+    BLOCK = 1   # Policy BLOCK: no server met the trust threshold
+    PROBE = 2   # Routed to a probationary server as a recovery probe
+    FAIL = 3    # Executed on a trusted server, but the tool call failed
 
 # --- 2. REPUTATION POLICY CONFIGURATION (FIXED) ---
 
@@ -40,8 +50,12 @@ class RepScoreConfig:
     # *** CRITICAL FIX: ADDED MISSING ATTRIBUTE ***
     DEFAULT_INITIAL_SCORE: Final[float] = 0.50     # Starting score for unverified endpoints. 
     
+    # --- Fixed-Point Scale ---
+    SATISFACTION_SCALE: Final[int] = 10000         # Satisfaction/confidence are ints in basis points (10000 == 1.0).
+
     # --- System Constants ---
     REPUTATION_DECAY_HALF_LIFE_HOURS: Final[int] = 24 # Time period after which reputation begins to decay.
+    SELECTION_REBUILD_EPSILON: Final[float] = 0.01    # Score drift that triggers a rebuild of a tool's selection table.
 
 
 # --- 3. STATIC SERVER METADATA CATALOG (Expanded) ---
@@ -1,21 +1,222 @@
+import atexit
+import contextlib
 import json
+from collections import deque
+import queue
+import threading
 import time
 import os
+try:
+    import fcntl
+except ImportError: # Non-POSIX: no advisory locks, so only a single store per file is safe
+    fcntl = None
+
+WRITER_BATCH_SIZE = 64 # Max journal records coalesced into a single write syscall
+LOG_WINDOW = 50        # Telemetry entries retained per server
+FLUSH_TIMEOUT_SEC = 30.0 # Upper bound on how long flush() (incl. the atexit hook) waits for the writer
 
 class RepDataStore:
-    def __init__(self, filename: str = "mcp_trust_store.json"):
+    """
+    Append-only persistence for the trust fabric.
+    Every mutation is appended as one JSON line to a journal (`<filename>.log`);
+    the full state is only rewritten as a snapshot every `snapshot_every` records or on shutdown.
+    Disk I/O happens on a background writer thread so callers never block on a write.
+    """
+    def __init__(self, filename: str = "mcp_trust_store.json", snapshot_every: int = 32):
         self.filename = filename
+        self.journal_filename = filename + ".log"
+        self.snapshot_every = snapshot_every
+        self._pending_records = 0
         self._data = self._load_data()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._writer_loop, name="RepDataStore-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
 
     def _load_data(self) -> dict:
+        with self._journal_lock():
+            data, _ = self._read_disk()
+            self._terminate_torn_tail()
+        return data
+
+    def _terminate_torn_tail(self):
+        """Newline-terminates a torn final journal line so the next append starts a fresh, parseable record."""
+        try:
+            with open(self.journal_filename, 'rb+') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        except FileNotFoundError:
+            pass
+
+    def _read_disk(self):
+        """
+        Rebuilds state from the last snapshot plus every journal record written since.
+        Returns (data, lines_read); lines_read also counts skipped torn lines so compaction still clears them.
+        """
+        data = {}
+        lines_read = 0
         if os.path.exists(self.filename):
             with open(self.filename, 'r') as f:
-                return json.load(f)
-        return {}
+                data = json.load(f)
+            for entry in data.values():
+                if "LOGS" in entry:
+                    entry["LOGS"] = deque(entry["LOGS"], maxlen=LOG_WINDOW)
+
+        if os.path.exists(self.journal_filename):
+            with open(self.journal_filename, 'rb') as f:
+                for line in f:
+                    lines_read += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # Torn write from a crash; records appended after it are still intact
+                    self._apply_record(data, record)
+        return data, lines_read
+
+    @staticmethod
+    def _apply_record(data: dict, record: dict):
+        key = f"SERVER#{record['server_id']}"
+        entry = data.setdefault(key, {})
+        if record['op'] == "score":
+            entry["METADATA"] = record['metadata']
+        else:
+            entry.setdefault("LOGS", deque(maxlen=LOG_WINDOW)).append(record['telemetry'])
+
+    def _append_record(self, record: dict):
+        self._queue.put(("record", record))
+        self._pending_records += 1
+        if self._pending_records >= self.snapshot_every:
+            self._pending_records = 0
+            self._queue.put(("compact", None))
+
+    # --- Background Writer ---
+
+    def _writer_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITER_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process_batch(batch)
+            except Exception as e: # The writer must outlive any single bad batch
+                print(f"   [Store] Writer error, batch dropped: {e}")
+            finally:
+                # Never strand a flush() caller, whatever happened above
+                for op, payload in batch:
+                    if payload is not None and op == "compact": payload.set()
+            if any(op == "stop" for op, _ in batch):
+                return
+
+    def _process_batch(self, batch: list):
+        lines = []
+        for op, payload in batch:
+            if op == "record":
+                try:
+                    lines.append(json.dumps(payload, separators=(',', ':')).encode() + b"\n")
+                except (TypeError, ValueError) as e:
+                    print(f"   [Store] Skipping unserializable {payload['op']} record for {payload['server_id']}: {e}")
+                continue
+            if op == "stop":
+                continue # Handled by _writer_loop once the rest of the batch is on disk
+            # Compaction must see every record queued before it
+            self._write_journal(lines)
+            lines = []
+            try:
+                self._compact()
+            except Exception as e:
+                print(f"   [Store] Snapshot failed: {e}")
+            finally:
+                if payload is not None: payload.set()
+        self._write_journal(lines)
+
+    def _write_journal(self, lines: list):
+        if not lines:
+            return
+        try:
+            with self._journal_lock():
+                fd = os.open(self.journal_filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    self._write_all(fd, lines)
+                finally:
+                    os.close(fd)
+        except OSError as e:
+            print(f"   [Store] Journal write failed: {e}")
+
+    @staticmethod
+    def _write_all(fd: int, lines: list):
+        """Writes every buffer, resuming after short writes (writev/write may accept only part of the data)."""
+        use_writev = hasattr(os, "writev")
+        bufs = [memoryview(line) for line in (lines if use_writev else [b"".join(lines)])]
+        while bufs:
+            written = os.writev(fd, bufs) if use_writev else os.write(fd, bufs[0])
+            while bufs and written >= len(bufs[0]):
+                written -= len(bufs[0])
+                bufs.pop(0)
+            if bufs and written:
+                bufs[0] = bufs[0][written:]
+
+    def _save_data(self, data: dict):
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, 'w') as f:
+            json.dump(data, f, separators=(',', ':'), default=list) # LOGS deques serialize as lists
+        os.replace(tmp_filename, self.filename)
+
+    def _compact(self):
+        """
+        Folds the journal into a fresh snapshot.
+        State is rebuilt from disk rather than memory so records appended by other stores sharing the file survive;
+        the journal lock keeps their appends from landing between the replay and the truncate.
+        """
+        with self._journal_lock():
+            data, lines_read = self._read_disk()
+            if lines_read:
+                self._save_data(data)
+                open(self.journal_filename, 'wb').close()
+
+    @contextlib.contextmanager
+    def _journal_lock(self):
+        """Exclusive advisory lock (`<filename>.lock`) shared by journal appends and compaction across stores/processes."""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.filename + ".lock", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd) # Closing the descriptor releases the lock
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT_SEC) -> bool:
+        """
+        Blocks until every queued record is on disk and compacted into the snapshot.
+        Returns False (instead of hanging, e.g. at interpreter exit) if the writer is gone or misses the timeout.
+        """
+        if not self._writer.is_alive():
+            print("   [Store] Writer thread is not running; queued records were not flushed.")
+            return False
+        done = threading.Event()
+        self._queue.put(("compact", done))
+        if not done.wait(timeout):
+            print(f"   [Store] Flush timed out after {timeout:.0f}s.")
+            return False
+        self._pending_records = 0
+        return True
 
-    def _save_data(self):
-        with open(self.filename, 'w') as f:
-            json.dump(self._data, f, indent=4)
+    def close(self, timeout: float = FLUSH_TIMEOUT_SEC):
+        """Flushes, then stops the writer thread and drops the atexit hook. The store must not be written to afterwards."""
+        if not self._writer.is_alive():
+            return
+        self.flush(timeout)
+        self._queue.put(("stop", None))
+        self._writer.join(timeout)
+        atexit.unregister(self.flush)
 
     def get_server_metadata(self, server_id: str):
         key = f"SERVER#{server_id}"
@@ -24,18 +225,16 @@ class RepDataStore:
     def update_server_score(self, server_id: str, new_score: float, count: int):
         key = f"SERVER#{server_id}"
         if key not in self._data: self._data[key] = {}
-        self._data[key]["METADATA"] = {
+        metadata = {
             'score': round(float(new_score), 4),
             'last_update': time.time(),
             'interaction_count': count
         }
-        self._save_data()
+        self._data[key]["METADATA"] = metadata
+        self._append_record({'op': "score", 'server_id': server_id, 'metadata': metadata})
 
     def log_telemetry(self, server_id: str, telemetry: dict):
         key = f"SERVER#{server_id}"
-        if "LOGS" not in self._data[key]:
-            self._data[key]["LOGS"] = []
-        
-        self._data[key]["LOGS"].append(telemetry)
-        self._data[key]["LOGS"] = self._data[key]["LOGS"][-50:]
-        self._save_data()
+        # Bounded deque evicts the oldest entry in O(1); no per-call slice/copy
+        self._data.setdefault(key, {}).setdefault("LOGS", deque(maxlen=LOG_WINDOW)).append(telemetry)
+        self._append_record({'op': "telemetry", 'server_id': server_id, 'telemetry': telemetry})
@@ -1,42 +1,74 @@
+import copy
 import time
 import random
-import uuid
-from typing import Dict, Any, Optional, List
-from config import RepScoreConfig, ServerCatalog, ToolType, Status 
+import itertools
+import secrets
+import hashlib
+import logging
+import functools
+import sys
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple
+from config import RepScoreConfig, ServerCatalog, ToolType, Status, TaskStatus
 from repservice import RepScoreService 
 
+# Hot-path observability: lazy %-formatting, only rendered when a handler is enabled
+logger = logging.getLogger("rpl")
+
+@functools.lru_cache(maxsize=64)
+def _interpret_policy_cached(best_id: str, display_score: float, blocked: bool, cost_efficient: bool) -> str:
+    """Renders the policy recommendation; the block/cost verdicts are decided from raw values by the caller."""
+    summary = f"Recommendation: The best server is **{best_id}** (Score: {display_score:.4f}). "
+    if blocked:
+         summary += "WARNING: Reputation is too low; execution will be blocked."
+    elif cost_efficient:
+         summary += "It is highly cost-efficient and trustworthy."
+    else:
+         summary += "It meets reliability thresholds but has an average cost profile."
+    return summary
+
+@dataclass
+class TaskResult:
+    """Structured outcome of MCP_Client.execute_task: policy/execution status plus the agent-facing message."""
+    status: TaskStatus
+    message: str
+
 # --- MCP SERVER SIMULATION (Tool Provider) ---
 
 class MCP_Server:
     """The specialized computation/data server."""
-    def __init__(self, server_id: str, tool_type: ToolType, error_rate: float, avg_latency: float, cost_per_unit: float):
+    def __init__(self, server_id: str, tool_type: ToolType, error_rate: float, avg_latency: float, cost_per_unit: float, fast_mode: bool = False, seed: Optional[int] = None):
         self.server_id = server_id
         self.tool_type = tool_type
         self.error_rate = error_rate
         self.avg_latency = avg_latency
         self.cost_per_unit = cost_per_unit
+        self.fast_mode = fast_mode # Skip the simulated wall-clock delay (batch/benchmark runs)
+        # Private generator: no shared module-level state between servers/threads; seeded runs are reproducible per server
+        self._rng = random.Random(f"{seed}:{server_id}") if seed is not None else random.Random()
 
     def execute_tool(self, client_request: str) -> Dict[str, Any]:
         """Simulates tool execution and returns rich metadata."""
-        latency = abs(random.gauss(self.avg_latency, 0.05))
-        time.sleep(latency * 0.1) 
+        latency = abs(self._rng.gauss(self.avg_latency, 0.05))
+        if not self.fast_mode:
+            time.sleep(latency * 0.1) 
         
-        compute_units = random.randint(50, 150)
+        compute_units = self._rng.randint(50, 150)
         cost = compute_units * self.cost_per_unit
         
         # Use Status enum for consistency
-        if random.random() < self.error_rate:
+        if self._rng.random() < self.error_rate:
             return {
                 "status": Status.ERROR.value,
                 "result": f"Execution failed: {self.server_id} fault.", 
-                "latency": latency, "compute_cost": cost, "server_confidence": 0.2
+                "latency": latency, "compute_cost": cost, "server_confidence": 2000 # 0.20 in basis points
             }
         
         return {
             "status": Status.SUCCESS.value,
             "result": f"Result for '{client_request}'. Used {compute_units} units.",
             "latency": latency, "compute_cost": cost, 
-            "server_confidence": round(random.uniform(0.75, 0.99), 4)
+            "server_confidence": self._rng.randint(7500, 9900) # 0.75-0.99 in basis points
         }
 
 
@@ -46,51 +78,69 @@ class MCP_Client:
     """
     The AI Agent implementing the Reputation Policy Layer (RPL) as smart tool-routing middleware.
     """
-    def __init__(self, rep_service: RepScoreService):
+    def __init__(self, rep_service: RepScoreService, fast_mode: bool = False, seed: Optional[int] = None):
         self.rep_service = rep_service
-        self.servers: Dict[str, MCP_Server] = self._initialize_servers()
+        self.fast_mode = fast_mode
+        self.seed = seed
+        # Routing draws (recovery probe, weighted pick) share one generator, so a seeded client reproduces its routes
+        self._rng = random.Random(f"{seed}:client") if seed is not None else random.Random()
+        # Pristine catalog-configured servers; the live dict holds shallow clones so reset() never re-runs construction
+        self._server_templates: Dict[str, MCP_Server] = self._initialize_servers()
+        self.servers: Dict[str, MCP_Server] = {s_id: copy.copy(server) for s_id, server in self._server_templates.items()}
+        # Transaction IDs: one random session prefix, then a local counter (no per-task urandom read)
+        self._session_id = secrets.token_hex(4)
+        self._tx_counter = itertools.count()
         print("🤖 MCP Client initialized. Agentic RPL is active.")
 
     def _initialize_servers(self) -> Dict[str, MCP_Server]:
         """Creates MCP_Server instances from the static catalog."""
         servers = {}
         for s_id, s_data in ServerCatalog.CATALOG.items():
-            servers[s_id] = MCP_Server(server_id=s_id, **s_data)
+            servers[s_id] = MCP_Server(server_id=s_id, fast_mode=self.fast_mode, seed=self.seed, **s_data)
         return servers
 
+    def reset(self):
+        """
+        Restores every server to its catalog configuration, discarding per-test overrides.
+        Clones share their template's RNG, so random streams continue across resets rather than restarting.
+        """
+        self.servers = {s_id: copy.copy(server) for s_id, server in self._server_templates.items()}
+
     def _interpret_policy_llm(self, candidates: List[Dict[str, Any]]) -> str:
         """Simulates the Natural-Language Policy Interface/LLM Layer."""
         if not candidates: return "Recommendation: No available servers for this task."
         best = candidates[0]
-        summary = f"Recommendation: The best server is **{best['server_id']}** (Score: {best['score']:.4f}). "
-        if best['score'] < RepScoreConfig.MIN_REPUTATION_THRESHOLD:
-             summary += "WARNING: Reputation is too low; execution will be blocked."
-        elif best['cost'] < RepScoreConfig.COST_BENCHMARK:
-             summary += "It is highly cost-efficient and trustworthy."
-        else:
-             summary += "It meets reliability thresholds but has an average cost profile."
-        return summary
-
-    def _determine_satisfaction(self, outcome: str, latency: float, server_confidence: float) -> float:
-        """Agentic mechanism to derive implicit client satisfaction (Pillar 2: Feedback Loop)."""
-        # Check against the Status enum value for correctness
-        if outcome == Status.SUCCESS.value:
-            latency_penalty = min(0.5, latency * 1.5)
-            confidence_bonus = server_confidence * 0.1
-            satisfaction = max(0.2, 1.0 - latency_penalty + confidence_bonus) 
+        score = best['score']
+        # Keyed on the displayed (4dp) score; the verdicts compare the raw values, exactly as selection does
+        return _interpret_policy_cached(
+            best['server_id'], round(score, 4),
+            score < RepScoreConfig.MIN_REPUTATION_THRESHOLD, best['cost'] < RepScoreConfig.COST_BENCHMARK,
+        )
+
+    def _determine_satisfaction(self, outcome: int, latency: float, server_confidence: int) -> int:
+        """
+        Agentic mechanism to derive implicit client satisfaction (Pillar 2: Feedback Loop).
+        Works in fixed-point basis points (RepScoreConfig.SATISFACTION_SCALE == 1.0); no float rounding.
+        """
+        scale = RepScoreConfig.SATISFACTION_SCALE
+        # Integer compare against the Status enum
+        if outcome == Status.SUCCESS:
+            latency_penalty = min(scale // 2, int(latency * 1.5 * scale))
+            confidence_bonus = server_confidence // 10
+            satisfaction = max(scale // 5, scale - latency_penalty + confidence_bonus) 
         else:
-            satisfaction = 0.1
-        return round(satisfaction, 4)
+            satisfaction = scale // 10
+        return satisfaction
     
     def _create_log_entry(self, server_id: str, request: str, response: Dict[str, Any]) -> Dict[str, Any]:
         """Formats the transaction into the rich telemetry structure (Pillar 1)."""
         satisfaction = self._determine_satisfaction(response['status'], response['latency'], response['server_confidence'])
         
         return {
-            'transaction_id': str(uuid.uuid4()),
+            'transaction_id': f"{self._session_id}-{next(self._tx_counter)}",
             'timestamp_utc': time.time(),
             'server_id': server_id,
-            'request_params_hash': hash(request),
+            'request_params_hash': hashlib.blake2b(request.encode(), digest_size=8).hexdigest(), # Stable across runs, unlike hash()
             'outcome_status': response['status'],
             'latency_sec': response['latency'],
             'compute_cost_units': response['compute_cost'],
@@ -98,34 +148,43 @@ class MCP_Client:
             'server_confidence': response['server_confidence'],
         }
     
-    def _select_best_server(self, tool_type: ToolType) -> Optional[str]:
-            candidates = self.rep_service.discover_servers(tool_type)
-            if not candidates: return None
+    def _select_best_server(self, tool_type: ToolType) -> Tuple[TaskStatus, Optional[str]]:
+            candidates = self.rep_service.discover_servers(tool_type, ranked=False)
+            if not candidates: return TaskStatus.BLOCK, None
 
-            # 1. Separate candidates into Trusted and Probationary
-            trusted = [c for c in candidates if c['score'] >= RepScoreConfig.MIN_REPUTATION_THRESHOLD]
-            probation = [c for c in candidates if c['score'] < RepScoreConfig.MIN_REPUTATION_THRESHOLD]
+            # 1. One pass finding the best Probationary candidate and whether any server is Trusted
+            has_trusted = False
+            best_probation = None
+            for c in candidates:
+                if c['score'] >= RepScoreConfig.MIN_REPUTATION_THRESHOLD:
+                    has_trusted = True
+                elif best_probation is None or c['score'] > best_probation['score']:
+                    best_probation = c
 
             # 2. Redemption Logic: 10% chance to pick a probationary server if it's the best of them
-            if probation and random.random() < 0.10:
-                best_probation = probation[0]
-                print(f"   ⚠️  [RECOVERY PROBE]: Testing blocked server {best_probation['server_id']}")
-                return best_probation['server_id']
-
-            if not trusted:
-                print(f"   ❌ **Policy BLOCK**: No servers meet trust threshold.")
-                return None
-            
-            return trusted[0]['server_id']
+            if best_probation and self._rng.random() < 0.10:
+                logger.info("   ⚠️  [RECOVERY PROBE]: Testing blocked server %s", best_probation['server_id'])
+                return TaskStatus.PROBE, best_probation['server_id']
+
+            # 3. Reputation-weighted draw among trusted servers (spreads load, keeps exploring)
+            server_id = self.rep_service.sample_server(tool_type, rng=self._rng) if has_trusted else None
+            if server_id is None and has_trusted:
+                # The selection table lagged a direct score write; rebuild it from live scores and draw once more
+                server_id = self.rep_service.sample_server(tool_type, rebuild=True, rng=self._rng)
 
-    def execute_task(self, task_description: str, tool_type: ToolType):
+            if server_id is None:
+                logger.info("   ❌ **Policy BLOCK**: No servers meet trust threshold.")
+                return TaskStatus.BLOCK, None
+            return TaskStatus.OK, server_id
+
+    def execute_task(self, task_description: str, tool_type: ToolType) -> TaskResult:
         """The main execution loop: Discover -> Select -> Execute -> Log -> Feedback."""
-        print(f"\n--- 🚀 Client Task: {task_description} (Tool: {tool_type.name}) ---")
+        logger.info("\n--- 🚀 Client Task: %s (Tool: %s) ---", task_description, tool_type.name)
         
-        server_id = self._select_best_server(tool_type)
+        routing, server_id = self._select_best_server(tool_type)
         
         if server_id is None:
-            return f"Task failed: No trustworthy server found for {tool_type.name}."
+            return TaskResult(routing, f"Task failed: No trustworthy server found for {tool_type.name}.")
 
         # Execute Tool Request
         server = self.servers[server_id]
@@ -134,13 +193,17 @@ class MCP_Client:
         # Logging and Feedback Loop
         log_entry = self._create_log_entry(server_id, task_description, response)
         
-        print(f"   [Telemetry] Status: **{log_entry['outcome_status']}** | Latency: {log_entry['latency_sec']:.4f}s | Cost: ${log_entry['compute_cost_units']:.4f}")
-        print(f"   [Feedback] Satisfaction: {log_entry['client_satisfaction']:.4f} (Derived)")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   [Telemetry] Status: **%s** | Latency: %.4fs | Cost: $%.4f",
+                         Status(log_entry['outcome_status']).name, log_entry['latency_sec'], log_entry['compute_cost_units'])
+            logger.debug("   [Feedback] Satisfaction: %.4f (Derived)", log_entry['client_satisfaction'] / RepScoreConfig.SATISFACTION_SCALE)
         
         # Submit rich log to the Reputation Scoring Service
         self.rep_service.submit_feedback(log_entry)
         
-        return response['result']
+        if routing == TaskStatus.PROBE:
+            return TaskResult(TaskStatus.PROBE, response['result'])
+        return TaskResult(TaskStatus.OK if response['status'] == Status.SUCCESS else TaskStatus.FAIL, response['result'])
 
 # --- New Function: Interactive CLI ---
 
@@ -194,15 +257,16 @@ def interactive_agent_cli(client: MCP_Client):
         # The user's input now drives the core execution logic
         result = client.execute_task(prompt, tool_type)
         
-        print(f"\n[LLM Agent Received] Result: {result}")
+        print(f"\n[LLM Agent Received] Result: {result.message}")
         
-        # Display current status of all servers after the transaction
-        print("\n--- Current Reputation Audit ---")
-        for s_id, data in client.rep_service.reputations.items():
-            score_data = client.rep_service.reputations.get(s_id, {'score': 0.50})
-            selectable = score_data['score'] >= RepScoreConfig.MIN_REPUTATION_THRESHOLD
-            print(f"  {s_id:20} | Score: {score_data['score']:.4f} | Selectable: {selectable}")
-        print("-" * 30)
+        # Display current status of all servers after the transaction (with decay applied, not stale stored values)
+        client.rep_service.decay_all()
+        threshold = RepScoreConfig.MIN_REPUTATION_THRESHOLD
+        audit_rows = "\n".join(
+            f"  {s_id:20} | Score: {data.score:.4f} | Selectable: {data.score >= threshold}"
+            for s_id, data in client.rep_service.reputations.items()
+        )
+        print(f"\n--- Current Reputation Audit ---\n{audit_rows}\n" + "-" * 30)
 
     print("\nInteractive session closed. Final audit completed.")
 
@@ -210,6 +274,9 @@ def interactive_agent_cli(client: MCP_Client):
 # --- EXECUTION DEMO ---
 
 if __name__ == "__main__":
+    # Interactive sessions show the full per-task trace; benchmarks can raise this to WARNING
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s", stream=sys.stdout)
+
     # 1. Initialize the central RP Layer
     rep_service = RepScoreService()
     
@@ -230,6 +297,9 @@ if __name__ == "__main__":
     print("\n" + "="*90)
     print("FINAL AUDIT: SERVICE STATUS AFTER INTERACTIVE SESSION")
     print("="*90)
-    for s_id, data in rep_service.reputations.items():
-        selectable = data['score'] >= RepScoreConfig.MIN_REPUTATION_THRESHOLD
-        print(f"Server ID: {s_id:20} | Final Score: **{data['score']:.4f}** | Policy Selectable: {selectable}")
+    rep_service.decay_all()
+    threshold = RepScoreConfig.MIN_REPUTATION_THRESHOLD
+    print("\n".join(
+        f"Server ID: {s_id:20} | Final Score: **{data.score:.4f}** | Policy Selectable: {data.score >= threshold}"
+        for s_id, data in rep_service.reputations.items()
+    ))
@@ -1,7 +1,45 @@
 from datastore import RepDataStore
+import logging
+import heapq
+import math
+import random
 import time
-from typing import Dict, Any, List
-from config import RepScoreConfig, ServerCatalog, ToolType 
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, Any, List, Optional, Tuple
+from config import RepScoreConfig, ServerCatalog, ToolType, Status
+
+logger = logging.getLogger("rpl")
+
+# Module-level bindings for the per-feedback/per-read hot paths (one global load instead of a module attribute lookup)
+_monotonic = time.monotonic
+_exp = math.exp
+_by_score = itemgetter("score") # C-level sort key for discovery results
+
+def _build_alias_table(weights: List[float]) -> Tuple[List[float], List[int]]:
+    """Vose's alias method: O(k) build, then O(1) weighted draws. Weights must have a positive sum."""
+    n = len(weights)
+    total = sum(weights)
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = [0] * n
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] += scaled[s] - 1.0
+        (small if scaled[l] < 1.0 else large).append(l)
+    for i in large + small: # Leftovers are 1.0 up to floating-point error
+        prob[i] = 1.0
+    return prob, alias
+
+@dataclass(slots=True)
+class ReputationRow:
+    """Live reputation state for one server; slotted so hot-path field access skips a per-row dict."""
+    score: float
+    last_update: float # Monotonic clock
+    interaction_count: int = 0
 
 class RepScoreService:
     """
@@ -11,172 +49,336 @@ class RepScoreService:
     def __init__(self):
         self.server_catalog = ServerCatalog.CATALOG
         self.store = RepDataStore()  # Initialize the persistence layer
-        self.reputations: Dict[str, Dict[str, Any]] = {}
+        self.reputations: Dict[str, ReputationRow] = {}
+        self._by_tool: Dict[ToolType, List[str]] = {}
+        self._avg_cost_by_tool: List[float] = self._build_avg_cost_table()
+        self._cost_factor: Dict[str, float] = self._build_cost_factor_table()
+        # Reputation-weighted selection: per-tool alias tables, rebuilt lazily once scores drift
+        self._alias_tables: Dict[ToolType, Optional[Tuple[List[str], List[float], List[int]]]] = {}
+        self._alias_basis: Dict[str, float] = {}
+        self._alias_stale: set = set()
+        self._rng = random.Random() # Default draw source; callers wanting reproducible routing pass their own
+        # Decay rate per second: exp(k * t) == 0.5 ** (t / half_life)
+        self._decay_k = math.log(0.5) / (RepScoreConfig.REPUTATION_DECAY_HALF_LIFE_HOURS * 3600.0)
+        # Scoring constants bound once so the per-feedback path skips repeated class attribute lookups
+        self._w_sat = RepScoreConfig.WEIGHT_SATISFACTION
+        self._w_rel = RepScoreConfig.WEIGHT_RELIABILITY
+        self._w_lat = RepScoreConfig.WEIGHT_LATENCY_PENALTY
+        self._w_cost = RepScoreConfig.WEIGHT_COST_EFFICIENCY
+        self._max_lat = RepScoreConfig.MAX_ACCEPTABLE_LATENCY
+        self._alpha = RepScoreConfig.ALPHA_SMOOTHING
         self._initialize_reputations()
         print("✅ RepScore Service (Persistent Trust Fabric) initialized.")
 
+    @staticmethod
+    def _wall_to_monotonic(wall_timestamp: float) -> float:
+        """Maps a persisted wall-clock timestamp onto this process's monotonic clock (decay only ever uses deltas)."""
+        return time.monotonic() - (time.time() - wall_timestamp)
+
     def _hydrate_from_disk(self):
         for s_id in self.server_catalog:
             persisted = self.store.get_server_metadata(s_id)
             if persisted:
-                self.reputations[s_id]['score'] = persisted['score']
-                self.reputations[s_id]['last_update'] = persisted['last_update']
+                self.reputations[s_id].score = persisted['score']
+                self.reputations[s_id].last_update = self._wall_to_monotonic(persisted['last_update'])
 
     def _initialize_reputations(self):
-        current_time = time.time()
-        for s_id in self.server_catalog:
+        # In-memory timestamps are monotonic so wall-clock jumps (NTP, manual set) never skew decay
+        current_time = time.monotonic()
+        for s_id, data in self.server_catalog.items():
+            # Index servers by tool type once so discovery never scans the full catalog
+            self._by_tool.setdefault(data["tool_type"], []).append(s_id)
+
             # First, try to load from the JSON store
             persisted = self.store.get_server_metadata(s_id)
             
             if persisted:
                 # Load historical state
-                self.reputations[s_id] = {
-                    'score': persisted['score'],
-                    'last_update': persisted['last_update'],
-                    'interaction_count': persisted.get('interaction_count', 0)
-                }
+                self.reputations[s_id] = ReputationRow(
+                    score=persisted['score'],
+                    last_update=self._wall_to_monotonic(persisted['last_update']),
+                    interaction_count=persisted.get('interaction_count', 0)
+                )
                 print(f"   [Store] Hydrated {s_id}: {persisted['score']}")
             else:
                 # Fallback to default config
-                self.reputations[s_id] = {
-                    'score': RepScoreConfig.DEFAULT_INITIAL_SCORE, 
-                    'last_update': current_time,
-                    'interaction_count': 0
-                }
+                self.reputations[s_id] = ReputationRow(
+                    score=RepScoreConfig.DEFAULT_INITIAL_SCORE, 
+                    last_update=current_time,
+                    interaction_count=0
+                )
         
         # Custom starting scores for verified/competitive servers
-        self.reputations["compute_server_1"]['score'] = 0.85
-        self.reputations["data_server_2"]['score'] = 0.95
+        self.reputations["compute_server_1"].score = 0.85
+        self.reputations["data_server_2"].score = 0.95
         
         # NEW servers added to the ecosystem (Give them starting scores to be selectable/competitive)
         if "image_fast_4" in self.reputations:
-            self.reputations["image_fast_4"]['score'] = 0.88 # High initial trust
+            self.reputations["image_fast_4"].score = 0.88 # High initial trust
         if "image_cheap_5" in self.reputations:
-            self.reputations["image_cheap_5"]['score'] = 0.65 # Intentionally low trust (will be blocked)
+            self.reputations["image_cheap_5"].score = 0.65 # Intentionally low trust (will be blocked)
         if "semantic_db_6" in self.reputations:
-            self.reputations["semantic_db_6"]['score'] = 0.92 # High initial trust
+            self.reputations["semantic_db_6"].score = 0.92 # High initial trust
+
+        # Starting vector for reset(): (score, interaction_count) per server
+        self._initial_state = {s_id: (rep.score, rep.interaction_count) for s_id, rep in self.reputations.items()}
+
+    def reset(self):
+        """Restores every server to its post-initialization score (timestamps set to now) without re-reading the store."""
+        now = _monotonic()
+        for s_id, (score, count) in self._initial_state.items():
+            rep_data = self.reputations[s_id]
+            rep_data.score = score
+            rep_data.last_update = now
+            rep_data.interaction_count = count
+        # Selection tables are rebuilt from the restored scores on the next draw
+        self._alias_tables.clear()
+        self._alias_basis.clear()
+        self._alias_stale.clear()
 
 
     # --- New Logic: Time-Based Decay ---
 
-    def _apply_decay(self, server_id: str, current_rep: float, last_update_time: float) -> float:
+    def _apply_decay(self, server_id: str, current_rep: float, last_update_time: float, now: float) -> float:
         """Applies reputation decay based on time elapsed since the last transaction (Model Drift penalty)."""
-        time_elapsed = time.time() - last_update_time
-        
-        # Reference constant correctly from RepScoreConfig
-        half_life_seconds = RepScoreConfig.REPUTATION_DECAY_HALF_LIFE_HOURS * 3600
-        
-        if time_elapsed < 1: 
+        time_elapsed = now - last_update_time
+        # Sub-second gaps (back-to-back feedback, or a clock step backwards) leave the score untouched,
+        # so the floor clamp below never lifts a freshly penalized sub-floor score
+        if time_elapsed < 1:
+            return current_rep
+        # Scores at (or below) the floor have nothing to decay toward; skip the exp().
+        # The floor clamp below only bounds decay from above: it never lifts a sub-floor score.
+        if current_rep <= RepScoreConfig.DEFAULT_INITIAL_SCORE + 1e-9:
             return current_rep
 
         # Calculate decay factor
-        decay_periods = time_elapsed / half_life_seconds
-        decay_factor = pow(0.5, decay_periods)
+        decay_factor = _exp(self._decay_k * time_elapsed)
         score_differential = current_rep - RepScoreConfig.DEFAULT_INITIAL_SCORE
         decayed_score = RepScoreConfig.DEFAULT_INITIAL_SCORE + (score_differential * decay_factor)
         
         if decayed_score < current_rep - 0.001:
-            print(f"   [DECAY WARNING] {server_id}: Score decayed from {current_rep:.4f} to {decayed_score:.4f}.")
+            logger.info("   [DECAY WARNING] %s: Score decayed from %.4f to %.4f.", server_id, current_rep, decayed_score)
         return max(RepScoreConfig.DEFAULT_INITIAL_SCORE, decayed_score)
 
-    def get_reputation(self, server_id: str) -> float:
-        """API for clients to query the live Reputation Index, including decay check."""
-        rep_data = self.reputations.get(server_id)
-        if not rep_data:
-            return RepScoreConfig.DEFAULT_INITIAL_SCORE
+    def _decay_servers(self, server_ids: List[str], now: float) -> List[float]:
+        """
+        Decays a group of servers against a single clock read, writing decayed scores back in place.
+        Every score read is checked against the selection tables, including unchanged ones, so direct writes to
+        `reputations` (e.g. test setup) cannot leave a table drawing servers the policy would now block.
+        """
+        reputations = self.reputations
+        apply_decay = self._apply_decay
+        note_score = self._note_score
+        scores = []
+        for s_id in server_ids:
+            rep_data = reputations[s_id]
+            current_score = rep_data.score
+            decayed_score = apply_decay(s_id, current_score, rep_data.last_update, now)
+            if decayed_score < current_score:
+                rep_data.score = decayed_score
+                rep_data.last_update = now # Reset update time on read after decay
+            note_score(s_id, decayed_score)
+            scores.append(decayed_score)
+        return scores
 
-        current_score = rep_data['score']
-        last_update = rep_data['last_update']
-        decayed_score = self._apply_decay(server_id, current_score, last_update)
-        
-        if decayed_score < current_score:
-            self.reputations[server_id]['score'] = decayed_score
-            self.reputations[server_id]['last_update'] = time.time() # Reset update time on read after decay
-        return decayed_score
+    def _peek_decayed(self, server_id: str, now: float) -> float:
+        """Returns the server's decayed score without writing it back (for callers about to overwrite it)."""
+        rep_data = self.reputations[server_id]
+        return self._apply_decay(server_id, rep_data.score, rep_data.last_update, now)
+
+    def decay_all(self, now: Optional[float] = None):
+        """Brings every server's stored score up to date in one sweep (e.g. before an audit of `reputations`)."""
+        self._decay_servers(list(self.reputations), _monotonic() if now is None else now)
+
+    def get_reputation(self, server_id: str, now: Optional[float] = None) -> float:
+        """
+        API for clients to query the live Reputation Index, including decay check.
+        Callers already holding a timestamp pass it as `now` so one API call reads the clock once.
+        """
+        if server_id not in self.reputations:
+            return RepScoreConfig.DEFAULT_INITIAL_SCORE
+        if now is None:
+            now = _monotonic()
+        return self._decay_servers([server_id], now)[0]
 
     # --- Utility for Relative Cost Calculation (Defensive) ---
 
-    def _get_avg_cost_for_tool(self, tool_type: ToolType) -> float:
-        """Calculates the average declared cost for all available servers of a specific tool type."""
-        total_cost = 0.0
-        count = 0
+    def _build_avg_cost_table(self) -> List[float]:
+        """Averages the declared cost per tool type once (indexed by ToolType); the catalog is static at runtime."""
+        totals = [0.0] * len(ToolType)
+        counts = [0] * len(ToolType)
         for data in self.server_catalog.values():
-            if data["tool_type"] == tool_type:
-                total_cost += data.get("cost_per_unit", RepScoreConfig.COST_BENCHMARK) # Safer access
-                count += 1
-        
-        # Defensive Division Check (FAANG level robustness)
-        if count == 0:
-             return RepScoreConfig.COST_BENCHMARK
-        
-        return total_cost / count
+            tool_type = data["tool_type"]
+            totals[tool_type] += data.get("cost_per_unit", RepScoreConfig.COST_BENCHMARK) # Safer access
+            counts[tool_type] += 1
+        # Tool types with no registered servers fall back to the benchmark (no division by zero)
+        return [total / count if count else RepScoreConfig.COST_BENCHMARK for total, count in zip(totals, counts)]
 
-    def discover_servers(self, tool_type: ToolType) -> List[Dict[str, Any]]:
-        """Provides the client with all compatible servers and their current reputation."""
-        available_servers = []
+    def _get_avg_cost_for_tool(self, tool_type: ToolType) -> float:
+        """Returns the average declared cost for all available servers of a specific tool type."""
+        return self._avg_cost_by_tool[tool_type]
+
+    def _build_cost_factor_table(self) -> Dict[str, float]:
+        """Each server's cost factor depends only on static catalog prices, so it is evaluated once."""
+        cost_factors = {}
         for s_id, data in self.server_catalog.items():
-            if data["tool_type"] == tool_type:
-                score = self.get_reputation(s_id)
-                available_servers.append({
-                    "server_id": s_id, "score": score, "cost": data["cost_per_unit"], "tool_type": tool_type
-                })
-        return sorted(available_servers, key=lambda x: x["score"], reverse=True)
+            actual_unit_price = data['cost_per_unit']
+            avg_market_unit_price = self._get_avg_cost_for_tool(data['tool_type'])
+            # Reward servers that are cheaper than the market average
+            if actual_unit_price <= avg_market_unit_price:
+                # High reward for being cheaper than average
+                cost_factors[s_id] = 1.0
+            else:
+                # Penalty for being more expensive than market average
+                cost_factors[s_id] = max(0.0, 1.0 - (actual_unit_price - avg_market_unit_price) / avg_market_unit_price)
+        return cost_factors
 
-    def calculate_new_score(self, current_score: float, log_entry: Dict[str, Any]) -> float:
+    def discover_servers(self, tool_type: ToolType, ranked: bool = True, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Calculates the Multi-Factor Reputation Index update (RS).
-        Uses normalized unit-cost comparisons and clamped satisfaction scores.
+        Provides the client with all compatible servers and their current reputation.
+        Pass ranked=False to skip the sort when the caller only needs a single linear pass,
+        or top_k to get only the k best-scored servers (heap selection, O(N log k)).
         """
+        server_ids = self._by_tool.get(tool_type, [])
+        scores = self._decay_servers(server_ids, _monotonic())
+        available_servers = [
+            {"server_id": s_id, "score": score, "cost": self.server_catalog[s_id]["cost_per_unit"], "tool_type": tool_type}
+            for s_id, score in zip(server_ids, scores)
+        ]
+        if not ranked:
+            return available_servers
+        if top_k is not None:
+            return heapq.nlargest(top_k, available_servers, key=_by_score)
+        return sorted(available_servers, key=_by_score, reverse=True)
+
+    # --- Reputation-Weighted Selection ---
+
+    def _note_score(self, server_id: str, score: float):
+        """Marks the server's tool table stale once its score drifts or crosses the trust threshold."""
+        basis = self._alias_basis.get(server_id)
+        if basis is None:
+            return # Table never built for this tool; the first draw builds it
+        threshold = RepScoreConfig.MIN_REPUTATION_THRESHOLD
+        if abs(score - basis) > RepScoreConfig.SELECTION_REBUILD_EPSILON or (score >= threshold) != (basis >= threshold):
+            self._alias_stale.add(self.server_catalog[server_id]['tool_type'])
+
+    def _rebuild_alias_table(self, tool_type: ToolType):
+        server_ids = self._by_tool.get(tool_type, [])
+        threshold = RepScoreConfig.MIN_REPUTATION_THRESHOLD
+        weights = []
+        for s_id in server_ids:
+            score = self.reputations[s_id].score
+            self._alias_basis[s_id] = score
+            # Blocked servers get zero weight; they are only reachable through recovery probes
+            weights.append(score if score >= threshold else 0.0)
+        self._alias_tables[tool_type] = (server_ids, *_build_alias_table(weights)) if sum(weights) > 0 else None
+        self._alias_stale.discard(tool_type)
+
+    def sample_server(self, tool_type: ToolType, rebuild: bool = False, rng: Optional[random.Random] = None) -> Optional[str]:
+        """
+        Draws a trusted server with probability proportional to its reputation (O(1) per draw).
+        Returns None when no server of this tool type meets the trust threshold.
+        Pass rebuild=True to rebuild the table from live scores first (e.g. after writes to `reputations` that bypassed feedback),
+        and a seeded `rng` to make the draw reproducible.
+        """
+        if rebuild or tool_type in self._alias_stale or tool_type not in self._alias_tables:
+            self._rebuild_alias_table(tool_type)
+        table = self._alias_tables[tool_type]
+        if table is None:
+            return None
+        server_ids, prob, alias = table
+        if rng is None:
+            rng = self._rng
+        i = rng.randrange(len(server_ids))
+        return server_ids[i] if rng.random() < prob[i] else server_ids[alias[i]]
+
+    def _weighted_component_score(self, log_entry: Dict[str, Any]) -> float:
+        """Scores a single transaction (WCS) from its multi-factor telemetry; always in [0, 1]."""
         outcome = log_entry['outcome_status']
         latency = log_entry['latency_sec']
-        satisfaction = log_entry['client_satisfaction']
+        satisfaction = log_entry['client_satisfaction'] / RepScoreConfig.SATISFACTION_SCALE # Basis points -> [0, 1]
         server_id = log_entry['server_id']
-        tool_type = self.server_catalog[server_id]['tool_type']
-        actual_unit_price = self.server_catalog[server_id]['cost_per_unit']
-        avg_market_unit_price = self._get_avg_cost_for_tool(tool_type)
-        reliability_factor = 1.0 if outcome == "SUCCESS" else 0.0
-
-        # if latency == benchmark, factor is 0. If latency is 0, factor is 1.
-        latency_ratio = min(1.0, latency / RepScoreConfig.MAX_ACCEPTABLE_LATENCY)
-        latency_factor = 1.0 - latency_ratio
-        # Reward servers that are cheaper than the market average
-        if actual_unit_price <= avg_market_unit_price:
-            # High reward for being cheaper than average
-            cost_factor = 1.0 
-        else:
-            # Penalty for being more expensive than market average
-            cost_factor = max(0.0, 1.0 - (actual_unit_price - avg_market_unit_price) / avg_market_unit_price)
+        reliability_factor = float(outcome == Status.SUCCESS)
+
+        # if latency >= benchmark, factor is 0. If latency is 0, factor is 1.
+        latency_factor = max(0.0, 1.0 - latency / self._max_lat)
+        # Relative unit-cost standing vs. the tool's market average (precomputed from the catalog)
+        cost_factor = self._cost_factor[server_id]
 
         # We clamp satisfaction here too just in case it overflowed
         clamped_satisfaction = max(0.0, min(1.0, satisfaction))
         
-        WCS = (
-            RepScoreConfig.WEIGHT_SATISFACTION * clamped_satisfaction + 
-            RepScoreConfig.WEIGHT_RELIABILITY * reliability_factor + 
-            RepScoreConfig.WEIGHT_LATENCY_PENALTY * latency_factor +
-            RepScoreConfig.WEIGHT_COST_EFFICIENCY * cost_factor
+        return (
+            self._w_sat * clamped_satisfaction + 
+            self._w_rel * reliability_factor + 
+            self._w_lat * latency_factor +
+            self._w_cost * cost_factor
         )
 
+    def calculate_new_score(self, current_score: float, log_entry: Dict[str, Any]) -> float:
+        """
+        Calculates the Multi-Factor Reputation Index update (RS).
+        Uses normalized unit-cost comparisons and clamped satisfaction scores.
+        """
+        WCS = self._weighted_component_score(log_entry)
+
         # Exponential Moving Average (EMA) Update
-        new_score = (RepScoreConfig.ALPHA_SMOOTHING * WCS + (1 - RepScoreConfig.ALPHA_SMOOTHING) * current_score)
+        alpha = self._alpha
+        new_score = (alpha * WCS + (1 - alpha) * current_score)
         return round(max(0.0, min(1.0, new_score)), 4)
 
     def submit_feedback(self, log_entry: Dict[str, Any]):
         server_id = log_entry['server_id']
+        now = _monotonic() # Single clock read shared by decay and the update timestamp
         
-        # 1. Get current state
-        current_score = self.get_reputation(server_id)
-        count = self.reputations[server_id].get('interaction_count', 0) + 1
+        # 1. Get current state (decayed, but not written back: step 3 is the only write)
+        current_score = self._peek_decayed(server_id, now)
+        count = self.reputations[server_id].interaction_count + 1
         
         # 2. Compute new score
         new_score = self.calculate_new_score(current_score, log_entry)
         
         # 3. Update Memory
-        self.reputations[server_id]['score'] = new_score
-        self.reputations[server_id]['last_update'] = time.time()
-        self.reputations[server_id]['interaction_count'] = count
+        self.reputations[server_id].score = new_score
+        self._note_score(server_id, new_score)
+        self.reputations[server_id].last_update = now
+        self.reputations[server_id].interaction_count = count
         
         # 4. CRITICAL: Persist to Disk
         self.store.update_server_score(server_id, new_score, count)
         
-        print(f"   [RepScore Update] {server_id}: {current_score:.4f} -> **{new_score:.4f}** (Saved)")
+        logger.debug("   [RepScore Update] %s: %.4f -> **%.4f** (Saved)", server_id, current_score, new_score)
+
+    def submit_feedback_batch(self, log_entries: List[Dict[str, Any]]):
+        """
+        Bulk-ingests telemetry (e.g. replaying a log backlog) with one clock read and one write/persist per server.
+        The k per-server EMA steps are folded in closed form:
+            S_k = (1 - a)^k * S_0 + a * sum_i (1 - a)^(k - 1 - i) * WCS_i
+        """
+        by_server: Dict[str, List[float]] = {}
+        for log_entry in log_entries:
+            by_server.setdefault(log_entry['server_id'], []).append(self._weighted_component_score(log_entry))
+        if not by_server:
+            return
+
+        alpha = self._alpha
+        keep = 1.0 - alpha
+        now = _monotonic()
+        for server_id, wcs_values in by_server.items():
+            current_score = self._peek_decayed(server_id, now)
+            # Horner-style fold of the weighted sum: oldest sample ends up with the highest power of (1 - a)
+            weighted_sum = 0.0
+            for wcs in wcs_values:
+                weighted_sum = weighted_sum * keep + wcs
+            k = len(wcs_values)
+            new_score = round(max(0.0, min(1.0, keep ** k * current_score + alpha * weighted_sum)), 4)
+
+            rep_data = self.reputations[server_id]
+            count = rep_data.interaction_count + k
+            rep_data.score = new_score
+            self._note_score(server_id, new_score)
+            rep_data.last_update = now
+            rep_data.interaction_count = count
+            self.store.update_server_score(server_id, new_score, count)
+
+            logger.debug("   [RepScore Batch] %s: %.4f -> **%.4f** over %d events (Saved)", server_id, current_score, new_score, k)
@@ -1,10 +1,10 @@
 import os
-import sys
+import logging
 import shutil
 from io import StringIO
 from datetime import datetime
 from typing import Tuple
-from config import ToolType, RepScoreConfig, ServerCatalog 
+from config import ToolType, RepScoreConfig, TaskStatus
 from repservice import RepScoreService
 from mcp import MCP_Client 
 
@@ -112,7 +112,8 @@ TEST_CASES = [
 
 def setup_environment() -> Tuple[RepScoreService, MCP_Client]:
     rep_service = RepScoreService()
-    client = MCP_Client(rep_service)
+    # Latency is sampled, not measured, so skipping the simulated sleep leaves scores unchanged
+    client = MCP_Client(rep_service, fast_mode=True)
     return rep_service, client
 
 def run_tests(log_file):
@@ -120,66 +121,87 @@ def run_tests(log_file):
     log_file.write(f"Policy Threshold: {RepScoreConfig.MIN_REPUTATION_THRESHOLD}\n")
     log_file.write(f"Alpha Smoothing: {RepScoreConfig.ALPHA_SMOOTHING}\n\n")
     
-    rep_service_template, client_template = setup_environment()
-    initial_server_configs = {s_id: client_template.servers[s_id].__dict__.copy() for s_id in ServerCatalog.CATALOG}
+    # Route the RPL logger into one capture buffer, reused (seek/truncate) across every run
+    run_buffer = StringIO()
+    run_handler = logging.StreamHandler(run_buffer)
+    run_handler.setFormatter(logging.Formatter("%(message)s"))
+    rpl_logger = logging.getLogger("rpl")
+    previous_level = rpl_logger.level
+    rpl_logger.addHandler(run_handler)
+    rpl_logger.setLevel(logging.DEBUG)
 
+    # Build the service/client once (store load, indexes, server objects); each case only resets state
+    rep_service, client = setup_environment()
+    try:
+        _run_cases(log_file, run_buffer, rep_service, client)
+    finally:
+        # Release the store's writer thread and atexit hook so repeated runs don't accumulate them
+        rep_service.store.close()
+        # The logger is process-global: leave no handler (or forced level) behind for later callers
+        rpl_logger.removeHandler(run_handler)
+        rpl_logger.setLevel(previous_level)
+
+def _drain(run_buffer: StringIO) -> str:
+    """Returns everything captured so far and empties the buffer for reuse."""
+    captured = run_buffer.getvalue()
+    run_buffer.seek(0)
+    run_buffer.truncate()
+    return captured
+
+def _run_cases(log_file, run_buffer: StringIO, rep_service: RepScoreService, client: MCP_Client):
     for i, case in enumerate(TEST_CASES):
-        rep_service, client = setup_environment() 
+        rep_service.reset()
+        client.reset()
         target_server_id = case.get("server_id", "compute_server_1")
         decay_capture = None
 
         if "setup_changes" in case:
             changes = case["setup_changes"]
+            # client.reset() already swapped in a fresh clone of the catalog template; only overrides remain
             server = client.servers[target_server_id] 
             
-            for k, v in initial_server_configs[target_server_id].items():
-                if hasattr(server, k): setattr(server, k, v)
-                 
             server.error_rate = changes.get("error_rate", server.error_rate)
             server.avg_latency = changes.get("avg_latency", server.avg_latency)
             server.cost_per_unit = changes.get("cost_per_unit", server.cost_per_unit)
             
             if "starting_score" in changes:
-                rep_service.reputations[target_server_id]['score'] = changes["starting_score"]
+                rep_service.reputations[target_server_id].score = changes["starting_score"]
             
             log_file.write(f"[SETUP] Applied overrides to {target_server_id}\n")
 
         if "setup_sleep_hours" in case:
             sleep_sec = case["setup_sleep_hours"] * 3600
             for s_id, data in rep_service.reputations.items():
-                data['last_update'] -= sleep_sec 
+                data.last_update -= sleep_sec 
             
             # Capture decayed score BEFORE any tasks run
             decay_capture = rep_service.get_reputation(target_server_id)
             log_file.write(f"[DECAY CAPTURE] Score immediately after decay: {decay_capture:.4f}\n")
 
+        # Setup-time records (e.g. the T5 decay warning) stay in the setup section, not in run 1
+        log_file.write(_drain(run_buffer))
         log_file.write(f"\n--- Running Test Case {i+1}: {case['name']} ---\n")
         
         block_count = 0
         final_score = 0.0
         
         for run_num in range(case['runs']):
-            old_stdout = sys.stdout
-            sys.stdout = redirect_stdout = StringIO()
-
+            log_file.write(_drain(run_buffer)) # Clear before the run so it captures only its own records
             result = client.execute_task(case.get("prompt", "Default task"), case["tool_type"])
-
-            sys.stdout = old_stdout
-            run_log = redirect_stdout.getvalue()
-            log_file.write(run_log)
             
             # Count both hard blocks and probes as policy actions
-            if "Policy BLOCK" in run_log or "RECOVERY PROBE" in run_log:
+            if result.status in (TaskStatus.BLOCK, TaskStatus.PROBE):
                 block_count += 1
 
             final_score = rep_service.get_reputation(target_server_id) 
+            log_file.write(_drain(run_buffer)) # Includes any decay warning from the score read above
             
             if case.get("expect_block_run") and run_num + 1 == case["expect_block_run"]:
                 if block_count == 0:
                     log_file.write(f"[FAIL] Block expected at Run {run_num + 1}, but did not occur.\n")
                 else:
                     log_file.write(f"[PASS] Block/Probe policy triggered at Run {run_num + 1}.\n")
-        
+
         log_file.write(f"\n--- Verification for {case['name']} ---\n")
         
         # Use decay_capture for T5 assertion, final_score for others